@@ -1,151 +1,361 @@
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
 import streamlit as st
 import matplotlib.pyplot as plt
 from fpdf import FPDF
-import base64
 import pandas as pd
 
 # Set page config
 st.set_page_config(page_title="Submersible Pump Selector", layout="wide")
 
-# Pipe sizing recommendations
+# Pipe sizing recommendations: diameter (mm) -> (max flow LPH, velocity m/s)
 PIPE_SIZING = {
-    "32": {"Max Flow (LPH)": 2000, "Velocity (m/s)": 0.7},
-    "40": {"Max Flow (LPH)": 4000, "Velocity (m/s)": 0.9},
-    "50": {"Max Flow (LPH)": 7000, "Velocity (m/s)": 1.0},
-    "63": {"Max Flow (LPH)": 12000, "Velocity (m/s)": 1.1},
-    "75": {"Max Flow (LPH)": 18000, "Velocity (m/s)": 1.2},
-    "90": {"Max Flow (LPH)": 25000, "Velocity (m/s)": 1.3}
+    32: (2000, 0.7),
+    40: (4000, 0.9),
+    50: (7000, 1.0),
+    63: (12000, 1.1),
+    75: (18000, 1.2),
+    90: (25000, 1.3)
+}
+
+# Known column-name variations mapped back to (canonical name, priority),
+# inverted once at import so the loader resolves each sheet column with one
+# dict lookup. The priority preserves the alias order: when a sheet carries
+# several aliases of the same field, the earlier-listed one wins.
+COLUMN_ALIASES = {
+    alias: (standard_name, priority)
+    for standard_name, aliases in {
+        'pump': ['pump', 'model', 'pump model'],
+        'phase': ['phase', 'power phase', 'type'],
+        'hp': ['hp', 'horsepower', 'power'],
+        'qmin': ['qmin', 'min flow', 'minimum flow (lph)'],
+        'qmax': ['qmax', 'max flow', 'maximum flow (lph)'],
+        'hmin': ['hmin', 'min head', 'minimum head (m)'],
+        'hmax': ['hmax', 'max head', 'maximum head (m)']
+    }.items()
+    for priority, alias in enumerate(aliases)
 }
 
 # Hazen-Williams C values
 C_VALUES = {"PVC": 140, "GI": 120}
 
+# Precomputed constants per material/diameter choice: (C^1.852, d^4.87 in m,
+# flow area in m^2). The menus are fixed, so the pow() calls happen once at
+# import instead of on every calculation.
+PIPE_COEFF = {
+    (material, diameter): (
+        c ** 1.852,
+        (diameter / 1000.0) ** 4.87,
+        math.pi * (diameter / 1000.0) ** 2 / 4
+    )
+    for material, c in C_VALUES.items()
+    for diameter in PIPE_SIZING
+}
+
+# Scalar hydraulic model: friction loss, velocity head, TDH and required
+# power. Kept free of pandas/streamlit so numba can compile it; the njit
+# wrapper below is optional and mostly pays off when this module is reused
+# for parametric sweeps over many configurations.
+def compute_hydraulics(flow_m3ps, line_length, c_pow, d_pow, pipe_area,
+                       installation_depth, tank_height, safety_margin, efficiency):
+    # Friction loss (Hazen-Williams)
+    friction_loss = (10.67 * line_length * (flow_m3ps**1.852)) / (c_pow * d_pow)
+    minor_losses = 0.10 * friction_loss  # 10% for fittings
+    total_pipe_loss = friction_loss + minor_losses
+
+    # Velocity head
+    velocity = flow_m3ps / pipe_area
+    velocity_head = (velocity**2) / (2 * 9.81)
+
+    # TDH calculation
+    static_head = installation_depth + tank_height
+    tdh_without_safety = static_head + total_pipe_loss + velocity_head
+    safety_margin_value = (safety_margin / 100) * tdh_without_safety
+    tdh = tdh_without_safety + safety_margin_value
+
+    # Pump power
+    hp = (flow_m3ps * tdh * 1000 * 9.81) / (efficiency/100 * 745.7)
+
+    return total_pipe_loss, velocity, velocity_head, static_head, safety_margin_value, tdh, hp
+
+# JIT-compile the hydraulic model when numba is installed (optional dependency)
+try:
+    from numba import njit
+    compute_hydraulics = njit(cache=True, fastmath=True)(compute_hydraulics)
+except ImportError:
+    pass
+
 def create_pdf_report(data):
     pdf = FPDF()
     pdf.add_page()
-    pdf.set_font("Arial", size=12)
+    pdf.set_font("Helvetica", size=12)
 
     # Title
-    pdf.cell(200, 10, txt="Submersible Pump Selection Report", ln=1, align='C')
+    pdf.cell(200, 10, text="Submersible Pump Selection Report", align='C',
+             new_x="LMARGIN", new_y="NEXT")
     pdf.ln(10)
 
     # Input Parameters
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="Input Parameters:", ln=1)
-    pdf.set_font("Arial", size=10)
+    pdf.set_font("Helvetica", 'B', 12)
+    pdf.cell(200, 10, text="Input Parameters:", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=10)
 
-    for param, value in data['inputs'].items():
-        safe_value = str(value).encode('ascii', 'ignore').decode('ascii')
-        safe_param = str(param).encode('ascii', 'ignore').decode('ascii')
-        pdf.cell(200, 6, txt=f"{safe_param}: {safe_value}", ln=1)
+    # One multi_cell per section instead of one cell per row - FPDF pays
+    # font-metric and page-state overhead per call, not per line
+    input_lines = "\n".join(f"{param}: {value}" for param, value in data['inputs'].items())
+    pdf.multi_cell(0, 6, text=input_lines.encode('ascii', 'ignore').decode('ascii'))
 
     # Results
     pdf.ln(5)
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="Calculation Results:", ln=1)
-    pdf.set_font("Arial", size=10)
+    pdf.set_font("Helvetica", 'B', 12)
+    pdf.cell(200, 10, text="Calculation Results:", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=10)
 
-    for result, value in data['results'].items():
-        safe_value = str(value).replace(',', '').encode('ascii', 'ignore').decode('ascii')
-        safe_result = str(result).encode('ascii', 'ignore').decode('ascii')
-        pdf.cell(200, 6, txt=f"{safe_result}: {safe_value}", ln=1)
+    result_lines = "\n".join(f"{result}: {str(value).replace(',', '')}"
+                             for result, value in data['results'].items())
+    pdf.multi_cell(0, 6, text=result_lines.encode('ascii', 'ignore').decode('ascii'))
 
     # Recommendations
     if 'recommendations' in data:
         pdf.ln(5)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(200, 10, txt="Recommendations:", ln=1)
-        pdf.set_font("Arial", size=10)
+        pdf.set_font("Helvetica", 'B', 12)
+        pdf.cell(200, 10, text="Recommendations:", new_x="LMARGIN", new_y="NEXT")
+        pdf.set_font("Helvetica", size=10)
 
-        for rec in data['recommendations']:
-            safe_rec = str(rec).encode('ascii', 'ignore').decode('ascii')
-            pdf.cell(200, 6, txt=f"- {safe_rec}", ln=1)
+        rec_lines = "\n".join(f"- {rec}" for rec in data['recommendations'])
+        pdf.multi_cell(0, 6, text=rec_lines.encode('ascii', 'ignore').decode('ascii'))
 
     # Return as bytes
-    return pdf.output(dest='S').encode('latin-1')
+    return bytes(pdf.output())
 
 # Load pump data function with more robust column name handling
-def load_pump_data():
+# Cached so the Excel file is only read once per session; file_mtime busts the
+# cache when Pumps.xlsx changes on disk. Returns (data, errors) instead of
+# calling st.error directly so UI messages aren't cached along with the data.
+@st.cache_data(show_spinner=False)
+def load_pump_data(file_mtime=None):
     try:
+        # Prefer the Parquet copy: it preserves dtypes and reads far faster
+        # than the zip+XML parse openpyxl does on the Excel source. It is
+        # regenerated below whenever Pumps.xlsx is newer.
+        if os.path.exists("Pumps.parquet") and \
+           (file_mtime is None or os.path.getmtime("Pumps.parquet") >= file_mtime):
+            return pd.read_parquet("Pumps.parquet"), []
+
         pump_data = pd.read_excel("Pumps.xlsx")
         
         # Standardize column names (case insensitive, strip whitespace)
         pump_data.columns = [col.strip().lower() for col in pump_data.columns]
         
-        # Map expected column names to possible variations
-        column_mapping = {
-            'pump': ['pump', 'model', 'pump model'],
-            'phase': ['phase', 'power phase', 'type'],
-            'hp': ['hp', 'horsepower', 'power'],
-            'qmin': ['qmin', 'min flow', 'minimum flow (lph)'],
-            'qmax': ['qmax', 'max flow', 'maximum flow (lph)'],
-            'hmin': ['hmin', 'min head', 'minimum head (m)'],
-            'hmax': ['hmax', 'max head', 'maximum head (m)']
-        }
-        
-        # Find matching columns
-        final_columns = {}
-        for standard_name, possible_names in column_mapping.items():
-            for possible_name in possible_names:
-                if possible_name in pump_data.columns:
-                    final_columns[standard_name] = possible_name
-                    break
-        
+        # Find matching columns in one pass, keeping the best-ranked alias
+        # per canonical name (e.g. an 'hp' column beats 'power' no matter
+        # which comes first in the sheet)
+        candidates = {}
+        for col in pump_data.columns:
+            match = COLUMN_ALIASES.get(col)
+            if match is not None:
+                standard_name, priority = match
+                if standard_name not in candidates or priority < candidates[standard_name][0]:
+                    candidates[standard_name] = (priority, col)
+        final_columns = {standard_name: col for standard_name, (_, col) in candidates.items()}
+
         # Check if we found all required columns
         required_columns = ['pump', 'phase', 'hp', 'qmin', 'qmax', 'hmin', 'hmax']
         missing_columns = [col for col in required_columns if col not in final_columns]
         
         if missing_columns:
-            st.error(f"Missing required columns in Excel file: {', '.join(missing_columns)}")
-            st.error("Please ensure your Excel file has columns for: Pump, Phase, HP, Qmin, Qmax, Hmin, Hmax")
-            return None
+            return None, [
+                f"Missing required columns in Excel file: {', '.join(missing_columns)}",
+                "Please ensure your Excel file has columns for: Pump, Phase, HP, Qmin, Qmax, Hmin, Hmax"
+            ]
         
         # Rename columns to standard names
         pump_data = pump_data.rename(columns={v: k for k, v in final_columns.items()})
         
-        # Convert numeric columns to appropriate types
-        numeric_cols = ['hp', 'qmin', 'qmax', 'hmin', 'hmax']
-        for col in numeric_cols:
-            pump_data[col] = pd.to_numeric(pump_data[col], errors='coerce')
-        
-        # Sort by HP and then by Hmax (low to high)
-        pump_data = pump_data.sort_values(['hp', 'hmax'])
+        # Convert numeric columns in a single pass; a malformed cell raises
+        # and surfaces through the loader's error message below
+        pump_data = pump_data.astype({
+            'hp': 'float64', 'qmin': 'float64', 'qmax': 'float64',
+            'hmin': 'float64', 'hmax': 'float64'
+        })
         
-        return pump_data
-    
+        # Sort by HP and then by Hmax (low to high) - np.lexsort on the raw
+        # numeric arrays, with keys given least-significant first
+        order = np.lexsort((pump_data['hmax'].to_numpy(), pump_data['hp'].to_numpy()))
+        pump_data = pump_data.iloc[order].reset_index(drop=True)
+
+        # Save the normalized table as Parquet so future loads skip the
+        # Excel parse entirely (best effort - e.g. read-only deployments)
+        try:
+            pump_data.to_parquet("Pumps.parquet")
+        except OSError:
+            pass
+
+        return pump_data, []
+
     except Exception as e:
-        st.error(f"Error loading pump database: {str(e)}")
-        return None
+        return None, [f"Error loading pump database: {str(e)}"]
+
+# Structure-of-arrays view of the pump table: contiguous float64 columns so
+# the selection masks run on raw NumPy buffers instead of pandas columns
+PumpArrays = namedtuple('PumpArrays', ['pump', 'phase', 'hp', 'qmin', 'qmax', 'hmin', 'hmax'])
+
+# A single catalog row as plain scalars - cheaper to build from the SoA
+# arrays than a pandas Series and read with attribute access downstream
+Pump = namedtuple('Pump', PumpArrays._fields)
+
+# Extract the pump table columns into NumPy arrays, cached alongside the
+# DataFrame so the extraction happens once per loaded table
+@st.cache_data(show_spinner=False)
+def build_pump_arrays(pump_data):
+    return PumpArrays(
+        pump=pump_data['pump'].to_numpy(object),
+        phase=pump_data['phase'].to_numpy(object),
+        hp=pump_data['hp'].to_numpy(np.float64),
+        qmin=pump_data['qmin'].to_numpy(np.float64),
+        qmax=pump_data['qmax'].to_numpy(np.float64),
+        hmin=pump_data['hmin'].to_numpy(np.float64),
+        hmax=pump_data['hmax'].to_numpy(np.float64)
+    )
+
+# Revised pump selection function (vectorized - the table is sorted by HP
+# then Hmax, so np.argmax on a boolean mask gives the first matching row).
+# Returns the row position in the table and the match type.
+def select_pump(pump_arrays, required_hp, required_flow_lph, required_tdh):
+    hp = pump_arrays.hp
+
+    # hp is sorted ascending, so binary search gives the slice boundaries
+    # directly: rows with hp == required span start..split and rows with
+    # hp > required span split..end. Rows below start can never match.
+    start = int(np.searchsorted(hp, required_hp, side='left'))
+    split = int(np.searchsorted(hp, required_hp, side='right'))
+
+    if start == len(hp):
+        # No pump rated at or above the requirement - highest capacity pump
+        return len(hp) - 1, "last_resort"
+
+    flow_ok = (pump_arrays.qmin[start:] <= required_flow_lph) & \
+              (required_flow_lph <= pump_arrays.qmax[start:])
+    head_ok = (pump_arrays.hmin[start:] <= required_tdh) & \
+              (required_tdh <= pump_arrays.hmax[start:])
+    both_ok = flow_ok & head_ok
+
+    if split > start:
+        # First try to find exact HP match with suitable flow and head range
+        exact_match = both_ok[:split - start]
+        if exact_match.any():
+            return start + int(np.argmax(exact_match)), "exact_match"
+
+        # If the exact HP exists but none fit, try the next higher HP
+        higher_match = both_ok[split - start:]
+        if higher_match.any():
+            return split + int(np.argmax(higher_match)), "higher_hp_match"
 
-# Revised pump selection function
-def select_pump(pump_data, required_hp, required_flow_lph, required_tdh):
-    # First try to find exact HP match
-    exact_hp_pumps = pump_data[pump_data['hp'] == required_hp]
-    
-    # If exact HP exists, check flow and head range
-    if not exact_hp_pumps.empty:
-        for _, pump in exact_hp_pumps.iterrows():
-            if (pump['qmin'] <= required_flow_lph <= pump['qmax']) and \
-               (pump['hmin'] <= required_tdh <= pump['hmax']):
-                return pump, "exact_match"
-        
-        # If no exact HP with sufficient flow/head, try next higher HP
-        higher_hp_pumps = pump_data[pump_data['hp'] > required_hp]
-        if not higher_hp_pumps.empty:
-            for _, pump in higher_hp_pumps.iterrows():
-                if (pump['qmin'] <= required_flow_lph <= pump['qmax']) and \
-                   (pump['hmin'] <= required_tdh <= pump['hmax']):
-                    return pump, "higher_hp_match"
-    
     # If no matches yet, find first pump with HP >= required_hp that meets head requirements
-    suitable_pumps = pump_data[pump_data['hp'] >= required_hp]
-    if not suitable_pumps.empty:
-        for _, pump in suitable_pumps.iterrows():
-            if pump['hmin'] <= required_tdh <= pump['hmax']:
-                return pump, "tdh_match"
-    
+    if head_ok.any():
+        return start + int(np.argmax(head_ok)), "tdh_match"
+
     # Final fallback - highest capacity pump
-    return pump_data.iloc[-1], "last_resort"
+    return len(hp) - 1, "last_resort"
+
+# Full calculation pipeline: hydraulics plus pump selection, memoized on the
+# input values so re-clicking with unchanged inputs is served from cache.
+# The selected pump row comes back as a Pump namedtuple, which pickles
+# cleanly for the cache; pump_file_mtime keys the cache to the database file
+# state.
+@st.cache_data(show_spinner=False)
+def compute_pump_requirements(flow_lph, pipe_diameter_mm, pipe_type,
+                              installation_depth, tank_height,
+                              pumping_line_length, safety_margin, efficiency,
+                              head_per_stage, pump_file_mtime):
+    flow_m3ps = flow_lph / 3600000
+
+    # Pipe constants (looked up from the precomputed table)
+    c_pow, d_pow, pipe_area = PIPE_COEFF[(pipe_type, pipe_diameter_mm)]
+
+    # Friction losses, velocity head, TDH and required power
+    (total_pipe_loss, velocity, velocity_head, static_head,
+     safety_margin_value, tdh, hp) = compute_hydraulics(
+        flow_m3ps, pumping_line_length, c_pow, d_pow, pipe_area,
+        installation_depth, tank_height, safety_margin, efficiency)
+
+    hp_rounded = max(0.5, round(hp + 0.4))  # Round up to nearest 0.5 HP
+    kw = hp * 0.7457
+
+    # Number of stages (now just informational, not used for selection)
+    num_stages = int(tdh / head_per_stage + 0.5)
+
+    # Pump selection (the loader and array builder are themselves cached)
+    pump_data, load_errors = load_pump_data(pump_file_mtime)
+    selected_pump = None
+    match_type = None
+    if pump_data is not None:
+        pump_arrays = build_pump_arrays(pump_data)
+        selected_idx, match_type = select_pump(pump_arrays, hp_rounded, flow_lph, tdh)
+        selected_pump = Pump._make(column[selected_idx] for column in pump_arrays)
+
+    return {
+        'flow_m3ps': flow_m3ps,
+        'total_pipe_loss': total_pipe_loss,
+        'velocity': velocity,
+        'velocity_head': velocity_head,
+        'static_head': static_head,
+        'safety_margin_value': safety_margin_value,
+        'tdh': tdh,
+        'hp': hp,
+        'hp_rounded': hp_rounded,
+        'kw': kw,
+        'num_stages': num_stages,
+        'selected_pump': selected_pump,
+        'match_type': match_type,
+        'load_errors': load_errors
+    }
+
+# Markdown blocks for the results panes, built once at import and filled in
+# with str.format per render (same text the old inline f-strings produced)
+HYDRAULIC_MD = """
+        **Hydraulic Requirements:**
+        - Total Daily Demand: {demand_liters:,.0f} liters
+        - Required Flow Rate: {flow_lph:,.0f} LPH ({flow_lps:.2f} L/s)
+        - Total Dynamic Head (TDH): {tdh:.1f} m
+        """
+
+HEAD_LOSS_MD = """
+            - Static Head: {static_head:.1f} m
+            - Pipe Friction Loss: {total_pipe_loss:.1f} m
+            - Velocity Head: {velocity_head:.2f} m
+            - Safety Margin: {safety_margin_value:.1f} m
+            """
+
+PUMP_SPEC_MD = """
+        **Pump Specifications:**
+        - Required Power: {hp:.1f} HP → **Use {hp_rounded} HP** ({kw:.1f} kW)
+        - Estimated Stages: {num_stages} (based on {head_per_stage}m per stage)
+        - Recommended RPM: 2850 (for standard 4" pumps)
+        """
+
+PIPE_EVAL_MD = """
+    - Selected Pipe: {pipe_diameter_mm}mm {pipe_type}
+    - Actual Flow Velocity: {velocity:.2f} m/s ({velocity_status})
+    - Recommended Max Flow for this pipe: {pipe_max_flow:,} LPH
+    """
+
+PUMP_MODEL_MD = """
+            **Model:** {pump.pump}  
+            **Phase:** {pump.phase}  
+            **Power:** {pump.hp} HP  
+            **Flow Range:** {pump.qmin}-{pump.qmax} LPH  
+            """
+
+PUMP_RANGE_MD = """
+            **Head Range:** {pump.hmin}-{pump.hmax} m  
+            **Your TDH:** {tdh:.1f} m  
+            **Your Flow:** {flow_lph:,.0f} LPH  
+            **Compatibility:** {compatibility}  
+            """
 
 # Main app
 st.title("Submersible Pump Selector")
@@ -171,7 +381,7 @@ with col1:
 
 with col2:
     st.subheader("Piping System")
-    pipe_diameter_mm = st.selectbox("Pumping Line Diameter (mm)", [32, 40, 50, 63, 75, 90], index=2)
+    pipe_diameter_mm = st.selectbox("Pumping Line Diameter (mm)", list(PIPE_SIZING), index=2)
     pipe_type = st.selectbox("Piping Material", ["PVC", "GI"], index=0)
     
     st.subheader("Pump Parameters")
@@ -181,122 +391,98 @@ with col2:
 
 # Calculations
 if st.button("Calculate Pump Requirements"):
-    # Basic calculations
+    # Check yield sufficiency first - the required flow only needs the demand
+    # inputs, so invalid input stops here before any hydraulic math runs
     demand_liters = num_taps * demand_per_tap
     flow_lph = demand_liters / pumping_hours
-    flow_m3ps = flow_lph / 3600000
-    
-    # Check yield sufficiency
     if flow_lph > yield_lph:
         st.error("⚠️ Required flow exceeds borewell yield! Reduce demand or increase pumping hours.")
         st.stop()
-    
-    # Pipe calculations
-    pipe_diameter_m = pipe_diameter_mm / 1000.0
-    C = C_VALUES.get(pipe_type, 140)
-    
-    # Friction loss (Hazen-Williams)
-    friction_loss = (10.67 * pumping_line_length * (flow_m3ps**1.852)) / (C**1.852 * pipe_diameter_m**4.87)
-    minor_losses = 0.10 * friction_loss  # 10% for fittings
-    total_pipe_loss = friction_loss + minor_losses
-    
-    # Velocity head
-    pipe_area = 3.1416 * (pipe_diameter_m**2) / 4
-    velocity = flow_m3ps / pipe_area
-    velocity_head = (velocity**2) / (2 * 9.81)
-    
-    # TDH calculation
-    static_head = installation_depth + tank_height
-    tdh_without_safety = static_head + total_pipe_loss + velocity_head
-    safety_margin_value = (safety_margin / 100) * tdh_without_safety
-    tdh = tdh_without_safety + safety_margin_value
-    
-    # Pump power
-    hp = (flow_m3ps * tdh * 1000 * 9.81) / (efficiency/100 * 745.7)
-    hp_rounded = max(0.5, round(hp + 0.4))  # Round up to nearest 0.5 HP
-    kw = hp * 0.7457
-    
-    # Number of stages (now just informational, not used for selection)
-    num_stages = int(tdh / head_per_stage + 0.5)
-    
+
+    try:
+        pump_file_mtime = os.path.getmtime("Pumps.xlsx")
+    except OSError:
+        pump_file_mtime = None
+
+    calc = compute_pump_requirements(flow_lph, pipe_diameter_mm, pipe_type,
+                                     installation_depth, tank_height,
+                                     pumping_line_length, safety_margin,
+                                     efficiency, head_per_stage, pump_file_mtime)
+    flow_m3ps = calc['flow_m3ps']
+    total_pipe_loss = calc['total_pipe_loss']
+    velocity = calc['velocity']
+    velocity_head = calc['velocity_head']
+    static_head = calc['static_head']
+    safety_margin_value = calc['safety_margin_value']
+    tdh = calc['tdh']
+    hp = calc['hp']
+    hp_rounded = calc['hp_rounded']
+    kw = calc['kw']
+    num_stages = calc['num_stages']
+
     # Results display
     st.subheader("Results")
     
     col_res1, col_res2 = st.columns(2)
     
     with col_res1:
-        st.markdown(f"""
-        **Hydraulic Requirements:**
-        - Total Daily Demand: {demand_liters:,.0f} liters
-        - Required Flow Rate: {flow_lph:,.0f} LPH ({flow_m3ps*1000:.2f} L/s)
-        - Total Dynamic Head (TDH): {tdh:.1f} m
-        """)
-        
+        st.markdown(HYDRAULIC_MD.format(demand_liters=demand_liters,
+                                        flow_lph=flow_lph,
+                                        flow_lps=flow_m3ps*1000, tdh=tdh))
+
         # TDH Breakdown
         with st.expander("Head Loss Breakdown"):
-            st.markdown(f"""
-            - Static Head: {static_head:.1f} m
-            - Pipe Friction Loss: {total_pipe_loss:.1f} m
-            - Velocity Head: {velocity_head:.2f} m
-            - Safety Margin: {safety_margin_value:.1f} m
-            """)
-    
+            st.markdown(HEAD_LOSS_MD.format(static_head=static_head,
+                                            total_pipe_loss=total_pipe_loss,
+                                            velocity_head=velocity_head,
+                                            safety_margin_value=safety_margin_value))
+
     with col_res2:
-        st.markdown(f"""
-        **Pump Specifications:**
-        - Required Power: {hp:.1f} HP → **Use {hp_rounded} HP** ({kw:.1f} kW)
-        - Estimated Stages: {num_stages} (based on {head_per_stage}m per stage)
-        - Recommended RPM: 2850 (for standard 4" pumps)
-        """)
+        st.markdown(PUMP_SPEC_MD.format(hp=hp, hp_rounded=hp_rounded, kw=kw,
+                                        num_stages=num_stages,
+                                        head_per_stage=head_per_stage))
     
     # Pipe sizing check
     st.subheader("Pipe Sizing Evaluation")
-    selected_pipe = str(pipe_diameter_mm)
-    pipe_max_flow = PIPE_SIZING[selected_pipe]["Max Flow (LPH)"]
-    pipe_velocity = PIPE_SIZING[selected_pipe]["Velocity (m/s)"]
+    pipe_max_flow, pipe_velocity = PIPE_SIZING[pipe_diameter_mm]
     
     velocity_status = "✅ Good" if velocity <= pipe_velocity else "⚠️ High - Consider larger pipe"
     
-    st.markdown(f"""
-    - Selected Pipe: {pipe_diameter_mm}mm {pipe_type}
-    - Actual Flow Velocity: {velocity:.2f} m/s ({velocity_status})
-    - Recommended Max Flow for this pipe: {pipe_max_flow:,} LPH
-    """)
+    st.markdown(PIPE_EVAL_MD.format(pipe_diameter_mm=pipe_diameter_mm,
+                                    pipe_type=pipe_type, velocity=velocity,
+                                    velocity_status=velocity_status,
+                                    pipe_max_flow=pipe_max_flow))
     
     if velocity > pipe_velocity:
         st.warning("High velocity detected! Consider increasing pipe size to reduce friction losses.")
     
-    # Load pump data and select pump
-    pump_data = load_pump_data()
-    
-    if pump_data is not None:
-        selected_pump, match_type = select_pump(pump_data, hp_rounded, flow_lph, tdh)
-        
+    # Report any pump database problems, then show the selected pump
+    for error_message in calc['load_errors']:
+        st.error(error_message)
+
+    if calc['selected_pump'] is not None:
+        selected_pump = calc['selected_pump']
+        match_type = calc['match_type']
+
         # Display pump selection with appropriate message
         st.subheader("Recommended Pump")
         col_pump1, col_pump2 = st.columns(2)
         
         with col_pump1:
-            st.markdown(f"""
-            **Model:** {selected_pump['pump']}  
-            **Phase:** {selected_pump['phase']}  
-            **Power:** {selected_pump['hp']} HP  
-            **Flow Range:** {selected_pump['qmin']}-{selected_pump['qmax']} LPH  
-            """)
-            
+            st.markdown(PUMP_MODEL_MD.format(pump=selected_pump))
+
         with col_pump2:
-            st.markdown(f"""
-            **Head Range:** {selected_pump['hmin']}-{selected_pump['hmax']} m  
-            **Your TDH:** {tdh:.1f} m  
-            **Your Flow:** {flow_lph:,.0f} LPH  
-            **Compatibility:** {'✅ Within range' if selected_pump['hmin'] <= tdh <= selected_pump['hmax'] and selected_pump['qmin'] <= flow_lph <= selected_pump['qmax'] else '⚠️ Outside optimal range'}  
-            """)
+            in_range = (selected_pump.hmin <= tdh <= selected_pump.hmax and
+                        selected_pump.qmin <= flow_lph <= selected_pump.qmax)
+            st.markdown(PUMP_RANGE_MD.format(
+                pump=selected_pump, tdh=tdh, flow_lph=flow_lph,
+                compatibility='✅ Within range' if in_range else '⚠️ Outside optimal range'))
         
         # Add match type explanation
         if match_type == "exact_match":
             st.success("Found pump matching exact HP, flow, and head requirements")
         elif match_type == "higher_hp_match":
-            st.warning(f"Using higher HP pump ({selected_pump['hp']} HP) that meets flow and head requirements")
+            st.warning(f"Using higher HP pump ({selected_pump.hp} HP) that meets flow and head requirements")
         elif match_type == "tdh_match":
             st.warning("Selected pump based on TDH requirements with different flow characteristics")
         else:
@@ -328,19 +514,24 @@ if st.button("Calculate Pump Requirements"):
                 'Pipe Sizing Status': velocity_status
             },
             'recommendations': [
-                f"Recommended pump: {selected_pump['pump']} ({selected_pump['hp']} HP)",
-                f"Flow range of pump: {selected_pump['qmin']} - {selected_pump['qmax']} LPH",
-                f"Head range of pump: {selected_pump['hmin']} - {selected_pump['hmax']} m",
-                f"TDH falls within range: {'Yes' if selected_pump['hmin'] <= tdh <= selected_pump['hmax'] else 'No'}",
-                f"Flow rate falls within range: {'Yes' if selected_pump['qmin'] <= flow_lph <= selected_pump['qmax'] else 'No'}"
+                f"Recommended pump: {selected_pump.pump} ({selected_pump.hp} HP)",
+                f"Flow range of pump: {selected_pump.qmin} - {selected_pump.qmax} LPH",
+                f"Head range of pump: {selected_pump.hmin} - {selected_pump.hmax} m",
+                f"TDH falls within range: {'Yes' if selected_pump.hmin <= tdh <= selected_pump.hmax else 'No'}",
+                f"Flow rate falls within range: {'Yes' if selected_pump.qmin <= flow_lph <= selected_pump.qmax else 'No'}"
             ]
         }
 
-        # Generate PDF
-        pdf_bytes = create_pdf_report(report_data)
-        b64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-        href = f'<a href="data:application/octet-stream;base64,{b64_pdf}" download="Pump_Selection_Report.pdf">📄 Download PDF Report</a>'
-        st.markdown(href, unsafe_allow_html=True)
+        # Generate the PDF only when the user actually clicks download - a
+        # callable defers the render. It must close over report_data directly:
+        # deferred data runs on a worker thread with no script context, so
+        # st.session_state is not available there. on_click="ignore" keeps the
+        # click from rerunning the script and wiping the results pane.
+        st.download_button("📄 Download PDF Report",
+                           data=lambda: create_pdf_report(report_data),
+                           file_name="Pump_Selection_Report.pdf",
+                           mime="application/pdf",
+                           on_click="ignore")
 
 # Add some spacings
 st.markdown("---")